@@ -2,13 +2,17 @@ import os
 import logging
 import asyncio
 import ipaddress
-import socket
+from collections import Counter
 from datetime import datetime
+from typing import Optional
 
-from utils import ServerManager, get_geo_ip
+from utils import MARZBAN_NODE_CERT, GeoInfo, ServerManager, get_geo_ip
 from marzban_node_api import NodeSetup
 
+from aiohttp import web
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from redis.asyncio import Redis
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.types import (
     ReplyKeyboardMarkup,
@@ -19,8 +23,15 @@ from aiogram.types import (
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.filters import BaseFilter, Command
 from aiogram.enums import ParseMode
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 
 load_dotenv()
@@ -36,10 +47,24 @@ ADMIN_IDS = [
     int(os.getenv("TG_CHAT_ID", "0")),
 ]
 
+# Webhook mode is used when WEBHOOK_URL is set, long polling otherwise
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/wh")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Abandoned setup dialogs (and the server password kept in them) expire after this,
+# via key TTLs in Redis and via expire_password() timers with MemoryStorage
+FSM_TTL = 900
+
+redis = Redis.from_url(os.getenv("REDIS_URL")) if os.getenv("REDIS_URL") else None
+
 marzban_api = NodeSetup(
     os.getenv("MARZBAN_USERNAME"),
     os.getenv("MARZBAN_PASSWORD"),
     os.getenv("MARZBAN_URL"),
+    cache=redis,
 )
 
 
@@ -57,25 +82,113 @@ def validate_ip_address(ip: str) -> bool:
         return False
 
 
-def check_port_availability(ip: str, port: int) -> bool:
+async def check_port_availability(ip: str, port: int, timeout: float = 1.5) -> bool:
     """Check port availability"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        result = sock.connect_ex((ip, port))
-        sock.close()
-        return result == 0
-    except Exception:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        # Only reachability matters, so don't wait for a graceful close
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
         return False
 
 
+# Strong references to pending expiry timers so they aren't garbage collected
+_password_timers = set()
+
+
+def expire_password(state: FSMContext, entered_at: float) -> None:
+    """Clear an abandoned dialog after FSM_TTL, as Redis key TTLs do"""
+
+    async def _expire():
+        await asyncio.sleep(FSM_TTL)
+        data = await state.get_data()
+        # A newer dialog has its own timer
+        if data.get("password_entered_at") == entered_at:
+            await state.clear()
+
+    task = asyncio.create_task(_expire())
+    _password_timers.add(task)
+    task.add_done_callback(_password_timers.discard)
+
+
 class IsAdmin(BaseFilter):
     async def __call__(self, message: types.Message) -> bool:
         return message.from_user.id in ADMIN_IDS
 
 
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Keep outgoing Telegram API calls under the global flood limit"""
+
+    def __init__(self, limiter: AsyncLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        async with self.limiter:
+            return await make_request(bot, method)
+
+
+class ProgressMessage:
+    """Progress message that coalesces edits sent in quick succession"""
+
+    def __init__(self, message: types.Message, interval: float = 0.5):
+        self.message = message
+        self.interval = interval
+        self._loop = asyncio.get_running_loop()
+        self._last_edit = self._loop.time()
+        self._pending: Optional[str] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def update(self, text: str) -> None:
+        """Show an intermediate step, delaying it if the last edit was recent"""
+        delay = self._last_edit + self.interval - self._loop.time()
+        if delay <= 0 and self._flush_task is None:
+            await self._edit(text)
+            return
+
+        self._pending = text
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def finish(self, text: str) -> None:
+        """Show the final result immediately, dropping pending steps"""
+        if self._flush_task is not None:
+            # Also stops an edit still in flight, so it can't overwrite the result
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._pending = None
+        await self._edit(text)
+
+    async def _flush(self) -> None:
+        try:
+            while self._pending is not None:
+                await asyncio.sleep(self._last_edit + self.interval - self._loop.time())
+                text, self._pending = self._pending, None
+                await self._edit(text)
+        except Exception as e:
+            logger.error(f"Progress update failed: {str(e)}")
+        finally:
+            self._flush_task = None
+
+    async def _edit(self, text: str) -> None:
+        self._last_edit = self._loop.time()
+        await self.message.edit_text(text)
+
+
 bot = Bot(token=os.getenv("TG_BOT_TOKEN"))
-dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(RateLimitMiddleware(AsyncLimiter(30, 1)))
+dp = Dispatcher(
+    storage=(
+        RedisStorage(redis, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+        if redis is not None
+        else MemoryStorage()
+    )
+)
 dp.message.filter(IsAdmin())
 
 
@@ -89,46 +202,36 @@ class NodeManagement(StatesGroup):
     waiting_for_delete_confirmation = State()
 
 
-def get_main_keyboard():
-    """Main keyboard with four main functions"""
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔧 Configure Node")],
-            [KeyboardButton(text="📋 Nodes")],
-            [KeyboardButton(text="📊 Statistics")],
-            [KeyboardButton(text="❓ Help")],
-        ],
-        resize_keyboard=True,
-        input_field_placeholder="Select action",
-    )
-    return keyboard
+# Static keyboards are built once and shared between handlers
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🔧 Configure Node")],
+        [KeyboardButton(text="📋 Nodes")],
+        [KeyboardButton(text="📊 Statistics")],
+        [KeyboardButton(text="❓ Help")],
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Select action",
+)
 
+CANCEL_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="❌ Cancel node creation")],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
 
-def get_cancel_keyboard():
-    """Cancel keyboard"""
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="❌ Cancel node creation")],
+PORTS_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="8443:8880 (Default)", callback_data="ports_8443_8880"
+            )
         ],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
-    return keyboard
-
-
-def get_ports_keyboard():
-    """Keyboard with suggested ports"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="8443:8880 (Default)", callback_data="ports_8443_8880"
-                )
-            ],
-            [InlineKeyboardButton(text="Enter manually", callback_data="ports_manual")],
-        ]
-    )
-    return keyboard
+        [InlineKeyboardButton(text="Enter manually", callback_data="ports_manual")],
+    ]
+)
 
 
 def get_delete_confirmation_keyboard(node_id: str, node_name: str):
@@ -174,7 +277,7 @@ Select the desired action from the keyboard below.
     """
 
     await message.answer(
-        welcome_text, reply_markup=get_main_keyboard(), parse_mode=ParseMode.HTML
+        welcome_text, reply_markup=MAIN_KEYBOARD, parse_mode=ParseMode.HTML
     )
 
 
@@ -183,7 +286,7 @@ async def configure_node_start(message: types.Message, state: FSMContext):
     """Start node configuration"""
     await message.answer(
         "Enter the server IP address:\n\n💡 Format: 192.168.1.100",
-        reply_markup=get_cancel_keyboard(),
+        reply_markup=CANCEL_KEYBOARD,
     )
     await state.set_state(NodeConfig.waiting_for_ip)
 
@@ -192,7 +295,7 @@ async def configure_node_start(message: types.Message, state: FSMContext):
 async def cancel_node_creation(message: types.Message, state: FSMContext):
     """Cancel node creation"""
     await state.clear()
-    await message.answer("❌ Node creation canceled.", reply_markup=get_main_keyboard())
+    await message.answer("❌ Node creation canceled.", reply_markup=MAIN_KEYBOARD)
 
 
 @dp.message(NodeConfig.waiting_for_ip)
@@ -205,30 +308,32 @@ async def process_ip(message: types.Message, state: FSMContext):
         if not validate_ip_address(ip):
             await message.answer(
                 "❌ Invalid IP address format. Please try again.\n\n💡 Example: 192.168.1.100",
-                reply_markup=get_cancel_keyboard(),
+                reply_markup=CANCEL_KEYBOARD,
             )
             return
 
         if ip in ["127.0.0.1", "localhost", "::1"]:
             await message.answer(
                 "❌ Cannot use localhost. Enter the external IP address of the server.",
-                reply_markup=get_cancel_keyboard(),
+                reply_markup=CANCEL_KEYBOARD,
             )
             return
 
         await message.answer("🔍 Checking server availability...")
-        if not check_port_availability(ip, 22):
+        if not await check_port_availability(ip, 22):
             await message.answer(
                 "⚠️ Attention: SSH port (22) is not available. Ensure the server is running and accessible.",
-                reply_markup=get_cancel_keyboard(),
+                reply_markup=CANCEL_KEYBOARD,
             )
 
         await state.update_data(ip=ip)
         log_admin_action(user_id, "IP_ENTERED", f"IP: {ip}")
 
         await message.answer(
-            "Enter the server password:\n\n🔒 The password will only be used for configuration and will not be saved",
-            reply_markup=get_cancel_keyboard(),
+            "Enter the server password:\n\n🔒 The password will only be used for configuration. "
+            f"It is held temporarily until the setup finishes (at most {FSM_TTL // 60} minutes) "
+            "and is not logged",
+            reply_markup=CANCEL_KEYBOARD,
         )
         await state.set_state(NodeConfig.waiting_for_password)
 
@@ -236,7 +341,7 @@ async def process_ip(message: types.Message, state: FSMContext):
         logger.error(f"Error processing IP {ip}: {str(e)}")
         await message.answer(
             "❌ An error occurred while processing the IP address. Please try again.",
-            reply_markup=get_cancel_keyboard(),
+            reply_markup=CANCEL_KEYBOARD,
         )
 
 
@@ -249,7 +354,7 @@ async def process_password(message: types.Message, state: FSMContext):
     if not password:
         await message.answer(
             "❌ Password cannot be empty. Please try again.",
-            reply_markup=get_cancel_keyboard(),
+            reply_markup=CANCEL_KEYBOARD,
         )
         return
 
@@ -257,15 +362,18 @@ async def process_password(message: types.Message, state: FSMContext):
         user_id, "PASSWORD_ENTERED", "Password length: " + str(len(password))
     )
 
-    await state.update_data(password=password)
+    entered_at = asyncio.get_running_loop().time()
+    await state.update_data(password=password, password_entered_at=entered_at)
+    if redis is None:
+        expire_password(state, entered_at)
 
     await message.answer(
         "Select the ports for the node or enter them manually:",
-        reply_markup=get_ports_keyboard(),
+        reply_markup=PORTS_KEYBOARD,
     )
 
 
-@dp.callback_query(F.data.startswith("ports_"))
+@dp.callback_query(NodeConfig.waiting_for_password, F.data.startswith("ports_"))
 async def process_ports_selection(callback: types.CallbackQuery, state: FSMContext):
     """Processing port selection"""
     await callback.answer()
@@ -273,7 +381,7 @@ async def process_ports_selection(callback: types.CallbackQuery, state: FSMConte
     if callback.data == "ports_manual":
         await callback.message.answer(
             "Enter the ports in the format service_port:api_port\n\n💡 Example: 8443:8880",
-            reply_markup=get_cancel_keyboard(),
+            reply_markup=CANCEL_KEYBOARD,
         )
         await state.set_state(NodeConfig.waiting_for_ports)
     else:
@@ -295,16 +403,34 @@ async def process_ports_manual(message: types.Message, state: FSMContext):
     except ValueError as e:
         await message.answer(
             f"❌ Invalid port format: {str(e)}. Please try again.\n\n💡 Example: 8443:8880",
-            reply_markup=get_cancel_keyboard(),
+            reply_markup=CANCEL_KEYBOARD,
         )
 
 
+# Hosts being set up by this process, guards against concurrent duplicate updates
+_setups_in_progress = set()
+
+
 async def process_node_setup(
     message: types.Message, state: FSMContext, service_port: int, api_port: int
 ):
     """Main node setup logic"""
     user_id = message.from_user.id
     data = await state.get_data()
+    # Clear the dialog before the long setup so repeated taps can't start it again
+    await state.clear()
+
+    if (
+        "ip" not in data
+        or "password" not in data
+        or data["ip"] in _setups_in_progress
+    ):
+        await message.answer(
+            "⚠️ Node setup is already running or has expired.",
+            reply_markup=MAIN_KEYBOARD,
+        )
+        return
+    _setups_in_progress.add(data["ip"])
 
     log_admin_action(
         user_id,
@@ -312,14 +438,20 @@ async def process_node_setup(
         f"IP: {data['ip']}, Ports: {service_port}:{api_port}",
     )
 
-    progress_msg = await message.answer("🔄 Starting node setup...")
+    try:
+        progress = ProgressMessage(await message.answer("🔄 Starting node setup..."))
+    except Exception:
+        _setups_in_progress.discard(data["ip"])
+        raise
 
     try:
-        await progress_msg.edit_text("📡 Connecting to the server...")
+        await progress.update("📡 Connecting to the server...")
         server_manager = ServerManager(data["ip"], data["password"])
 
-        await progress_msg.edit_text("⚙️ Configuring the server...")
-        setup_result = server_manager.setup_marzban_node(service_port, api_port)
+        await progress.update("⚙️ Configuring the server...")
+        setup_result = await asyncio.to_thread(
+            server_manager.setup_marzban_node, service_port, api_port
+        )
 
         if not setup_result["success"]:
             log_admin_action(
@@ -327,19 +459,15 @@ async def process_node_setup(
                 "NODE_SETUP_FAILED",
                 f"Server setup failed: {setup_result['error']}",
             )
-            await progress_msg.edit_text(
-                f"❌ Server setup failed: {setup_result['error']}"
-            )
-            await state.clear()
-            await message.answer("Select action:", reply_markup=get_main_keyboard())
+            await progress.finish(f"❌ Server setup failed: {setup_result['error']}")
             return
 
-        await progress_msg.edit_text("✅ Server configured successfully!")
+        await progress.update("✅ Server configured successfully!")
 
-        await progress_msg.edit_text("🔗 Adding node to Marzban...")
+        await progress.update("🔗 Adding node to Marzban...")
 
-        node_name = f"{get_geo_ip(data['ip'])}"
-        marzban_api.create_node(
+        node_name = (await get_geo_ip(data["ip"], marzban_api.session)).display
+        await marzban_api.create_node(
             name=node_name,
             address=data["ip"],
             port=service_port,
@@ -351,7 +479,7 @@ async def process_node_setup(
             user_id, "NODE_SETUP_COMPLETED", f"Node: {node_name}, IP: {data['ip']}"
         )
 
-        await progress_msg.edit_text(
+        await progress.finish(
             f"✅ Node added successfully!\n\n📋 Node information:\n"
             f"• Name: {node_name}\n"
             f"• Address: {data['ip']}\n"
@@ -363,11 +491,11 @@ async def process_node_setup(
     except Exception as e:
         log_admin_action(user_id, "NODE_SETUP_ERROR", f"Error: {str(e)}")
         logger.error(f"Node setup error for user {user_id}: {str(e)}")
-        await progress_msg.edit_text(f"❌ Error: {str(e)}")
+        await progress.finish(f"❌ Error: {str(e)}")
 
     finally:
-        await state.clear()
-        await message.answer("Select action:", reply_markup=get_main_keyboard())
+        _setups_in_progress.discard(data["ip"])
+        await message.answer("Select action:", reply_markup=MAIN_KEYBOARD)
 
 
 @dp.message(F.text == "📋 Nodes")
@@ -376,25 +504,23 @@ async def show_nodes(message: types.Message):
     try:
         await message.answer("📋 Loading node list...")
 
-        nodes = marzban_api.get_nodes()
+        nodes = await marzban_api.get_nodes()
 
         if not nodes:
             await message.answer("📭 Nodes not found.")
             return
 
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-
-        for node in nodes:
-            node_info = (
-                f"🗑️ {node.get('name', 'Unknown')} ({node.get('address', 'N/A')})"
-            )
-            keyboard.inline_keyboard.append(
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
                 [
                     InlineKeyboardButton(
-                        text=node_info, callback_data=f"node_{node['id']}"
+                        text=f"🗑️ {node.get('name', 'Unknown')} ({node.get('address', 'N/A')})",
+                        callback_data=f"node_{node['id']}",
                     )
                 ]
-            )
+                for node in nodes
+            ]
+        )
 
         await message.answer("Select a node to manage:", reply_markup=keyboard)
 
@@ -410,20 +536,24 @@ async def node_management(callback: types.CallbackQuery, state: FSMContext):
     node_id = callback.data.replace("node_", "")
 
     try:
-        nodes = marzban_api.get_nodes()
-        node = next((n for n in nodes if str(n["id"]) == node_id), None)
+        node = await marzban_api.get_node(node_id)
 
         if not node:
             await callback.message.answer("❌ Node not found.")
             return
 
-        node_info = f"📋 <b>Node information:</b>\n\n"
-        node_info += f"• ID: {node['id']}\n"
-        node_info += f"• Name: {node.get('name', 'N/A')}\n"
-        node_info += f"• Address: {node.get('address', 'N/A')}\n"
-        node_info += f"• Port: {node.get('port', 'N/A')}\n"
-        node_info += f"• API port: {node.get('api_port', 'N/A')}\n"
-        node_info += f"• Status: {'🟢 Active' if node.get('status') else '🔴 Inactive'}"
+        name, address, port, api_port = (
+            node.get(key, "N/A") for key in ("name", "address", "port", "api_port")
+        )
+        status = "🟢 Active" if node.get("status") else "🔴 Inactive"
+        node_info = f"""📋 <b>Node information:</b>
+
+• ID: {node['id']}
+• Name: {name}
+• Address: {address}
+• Port: {port}
+• API port: {api_port}
+• Status: {status}"""
 
         await callback.message.answer(
             node_info,
@@ -454,8 +584,7 @@ async def delete_node_confirmation(callback: types.CallbackQuery, state: FSMCont
         log_admin_action(user_id, "NODE_DELETE_STARTED", f"Node ID: {node_id}")
 
         try:
-            nodes = marzban_api.get_nodes()
-            node = next((n for n in nodes if str(n["id"]) == node_id), None)
+            node = await marzban_api.get_node(node_id)
 
             if not node:
                 await callback.message.answer("❌ Node not found.")
@@ -466,7 +595,7 @@ async def delete_node_confirmation(callback: types.CallbackQuery, state: FSMCont
 
             progress_msg = await callback.message.answer("🗑️ Deleting node...")
 
-            marzban_api.delete_node(node_id)
+            await marzban_api.delete_node(node_id)
 
             log_admin_action(
                 user_id,
@@ -548,23 +677,35 @@ async def show_statistics(message: types.Message):
     try:
         await message.answer("📊 Loading statistics...")
 
-        nodes = marzban_api.get_nodes()
+        nodes = await marzban_api.get_nodes()
 
         if not nodes:
             await message.answer("📭 Nodes not found.")
             return
 
+        geo_results = await asyncio.gather(
+            *(
+                get_geo_ip(node.get("address", ""), marzban_api.session)
+                for node in nodes
+            ),
+            return_exceptions=True,
+        )
+
+        status_counter = Counter()
+        countries = Counter()
+        for node, geo_info in zip(nodes, geo_results):
+            status_counter[bool(node.get("status"))] += 1
+            if isinstance(geo_info, GeoInfo):
+                countries[geo_info.country] += 1
+            else:
+                logger.error(
+                    f"Geo lookup failed for {node.get('address', 'N/A')}: {geo_info!r}"
+                )
+                countries["Unknown"] += 1
+
         total_nodes = len(nodes)
-        active_nodes = sum(1 for node in nodes if node.get("status"))
-        inactive_nodes = total_nodes - active_nodes
-
-        countries = {}
-        for node in nodes:
-            geo_info = get_geo_ip(node.get("address", ""))
-            country = (
-                geo_info.split("(")[-1].rstrip(")") if "(" in geo_info else "Unknown"
-            )
-            countries[country] = countries.get(country, 0) + 1
+        active_nodes = status_counter[True]
+        inactive_nodes = status_counter[False]
 
         stats_text = f"""
 📊 <b>Marzban nodes statistics</b>
@@ -577,9 +718,7 @@ async def show_statistics(message: types.Message):
 🌍 <b>By countries:</b>
 """
 
-        for country, count in sorted(
-            countries.items(), key=lambda x: x[1], reverse=True
-        ):
+        for country, count in countries.most_common():
             stats_text += f"• {country}: {count} nodes\n"
 
         stats_text += f"\n📅 Updated: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
@@ -591,9 +730,55 @@ async def show_statistics(message: types.Message):
         await message.answer(f"❌ Error loading statistics: {str(e)}")
 
 
+@dp.startup()
+async def on_startup():
+    """Register the webhook with Telegram"""
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET
+        )
+
+
+@dp.shutdown()
+async def on_shutdown():
+    """Release HTTP resources"""
+    await marzban_api.close()
+    if redis is not None:
+        await redis.aclose()
+
+
+async def run_webhook():
+    """Serve Telegram updates over an aiohttp webhook"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 async def main():
     """Start bot"""
-    await dp.start_polling(bot)
+    if not MARZBAN_NODE_CERT:
+        raise RuntimeError("MARZBAN_NODE_CERT is not set in the environment")
+
+    if WEBHOOK_URL:
+        # Without a secret anyone can post forged admin updates to the endpoint
+        if not WEBHOOK_SECRET:
+            raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_URL is set")
+        await run_webhook()
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
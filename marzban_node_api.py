@@ -1,17 +1,32 @@
-import requests
-import json
+import aiohttp
+import asyncio
+import base64
+import logging
+import orjson
 import os
+import time
+from typing import Optional
 from dotenv import load_dotenv
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+NODES_CACHE_KEY = "marzban:nodes"
+NODES_BY_ID_CACHE_KEY = "marzban:nodes:by_id"
+NODES_CACHE_TTL = 30
+
 
 class NodeSetup:
     """
     Class for managing Marzban nodes
     """
 
-    def __init__(self, username: str, password: str, url: str) -> None:
+    def __init__(
+        self, username: str, password: str, url: str, cache: Optional[Redis] = None
+    ) -> None:
         self.username = username
         self.password = password
         self.main_url = url
@@ -19,36 +34,137 @@ class NodeSetup:
         self.node_url = f"{self.main_url}/api/node"
         self.nodes_url = f"{self.main_url}/api/nodes"
         self.token = ""
+        self._token_expiry = 0.0
+        self._auth_header = {}
+        self._auth_lock: Optional[asyncio.Lock] = None
+        self.timeout = aiohttp.ClientTimeout(total=10)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Shared pooled HTTP session, created on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=20, ttl_dns_cache=300, keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                json_serialize=lambda obj: orjson.dumps(obj).decode(),
+            )
+        return self._session
 
-    def _auth(self) -> None:
+    async def close(self) -> None:
+        """Closing the HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _auth(self) -> None:
         auth_data = {"username": self.username, "password": self.password}
 
-        auth = requests.post(
-            self.auth_url,
-            data=auth_data,
-            timeout=10,
-        )
-        if auth.status_code == 200:
-            self.token = auth.json()["access_token"]
-        else:
-            raise Exception(f"Authentication failed: {auth.text}")
-
-    def get_nodes(self) -> dict:
-        nodes = requests.get(
-            self.nodes_url,
-            headers={"Authorization": f"Bearer {self.token}"},
-            timeout=10,
+        async with self.session.post(self.auth_url, data=auth_data) as auth:
+            if auth.status == 200:
+                self.token = (await auth.json(loads=orjson.loads))["access_token"]
+            else:
+                raise Exception(f"Authentication failed: {await auth.text()}")
+
+        self._token_expiry = self._token_exp(self.token) - 30
+        self._auth_header = {"Authorization": f"Bearer {self.token}"}
+
+    @staticmethod
+    def _token_exp(token: str) -> float:
+        """Reading the expiry time from the JWT payload"""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(orjson.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            # No readable expiry: rely on the 401 fallback
+            return float("inf")
+
+    def _token_valid(self, stale_token: Optional[str]) -> bool:
+        return (
+            bool(self.token)
+            and self.token != stale_token
+            and time.time() < self._token_expiry
         )
 
-        if nodes.status_code == 200:
-            return nodes.json()
-        elif nodes.status_code == 401:
-            self._auth()
-            return self.get_nodes()
-        else:
-            raise Exception(f"Nodes retrieval failed: {nodes.text}")
+    async def _ensure_token(self, stale_token: Optional[str] = None) -> None:
+        """Logging in unless a valid token is cached, one login at a time"""
+        if self._token_valid(stale_token):
+            return
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            # Another handler may have refreshed the token while we waited
+            if not self._token_valid(stale_token):
+                await self._auth()
+
+    async def _request(self, method: str, url: str, error: str, **kwargs) -> dict:
+        """Sending an authorized request, re-authenticating once on 401"""
+        await self._ensure_token()
+        for retry in (False, True):
+            token = self.token
+            async with self.session.request(
+                method, url, headers=self._auth_header, **kwargs
+            ) as response:
+                if response.status == 200:
+                    return await response.json(loads=orjson.loads)
+                elif response.status != 401 or retry:
+                    raise Exception(f"{error}: {await response.text()}")
+            await self._ensure_token(stale_token=token)
+
+    async def _invalidate_nodes(self) -> None:
+        if self.cache is None:
+            return
+        try:
+            await self.cache.delete(NODES_CACHE_KEY, NODES_BY_ID_CACHE_KEY)
+        except RedisError as e:
+            logger.error(f"Nodes cache invalidation failed: {str(e)}")
 
-    def create_node(
+    async def get_nodes(self) -> dict:
+        if self.cache is not None:
+            try:
+                cached = await self.cache.get(NODES_CACHE_KEY)
+                if cached:
+                    return orjson.loads(cached)
+            except RedisError as e:
+                logger.error(f"Nodes cache read failed: {str(e)}")
+
+        nodes = await self._request("GET", self.nodes_url, "Nodes retrieval failed")
+        if self.cache is not None:
+            try:
+                async with self.cache.pipeline() as pipe:
+                    pipe.set(NODES_CACHE_KEY, orjson.dumps(nodes), ex=NODES_CACHE_TTL)
+                    pipe.delete(NODES_BY_ID_CACHE_KEY)
+                    if nodes:
+                        pipe.hset(
+                            NODES_BY_ID_CACHE_KEY,
+                            mapping={str(n["id"]): orjson.dumps(n) for n in nodes},
+                        )
+                        pipe.expire(NODES_BY_ID_CACHE_KEY, NODES_CACHE_TTL)
+                    await pipe.execute()
+            except RedisError as e:
+                logger.error(f"Nodes cache write failed: {str(e)}")
+        return nodes
+
+    async def get_node(self, node_id: str) -> Optional[dict]:
+        """Getting a single node by ID, from the cache when possible"""
+        if self.cache is not None:
+            try:
+                cached = await self.cache.hget(NODES_BY_ID_CACHE_KEY, node_id)
+                if cached:
+                    return orjson.loads(cached)
+                if await self.cache.exists(NODES_CACHE_KEY):
+                    return None
+            except RedisError as e:
+                logger.error(f"Nodes cache read failed: {str(e)}")
+
+        nodes = await self.get_nodes()
+        return next((n for n in nodes if str(n["id"]) == node_id), None)
+
+    async def create_node(
         self, name: str, address: str, port: int, api_port: int, new_host: bool
     ) -> dict:
         node_data = {
@@ -59,39 +175,31 @@ class NodeSetup:
             "port": port,
             "usage_coefficient": 1,
         }
-        node = requests.post(
-            self.node_url,
-            headers={"Authorization": f"Bearer {self.token}"},
-            data=json.dumps(node_data),
-            timeout=10,
+        node = await self._request(
+            "POST", self.node_url, "Node creation failed", json=node_data
         )
-        if node.status_code == 200:
-            return node.json()
-        elif node.status_code == 401:
-            self._auth()
-            return self.create_node(name, address, port, api_port, new_host)
-        else:
-            raise Exception(f"Node creation failed: {node.text}")
-
-    def delete_node(self, node_id: str) -> dict:
-        node = requests.delete(
-            f"{self.node_url}/{node_id}",
-            headers={"Authorization": f"Bearer {self.token}"},
-            timeout=10,
+        await self._invalidate_nodes()
+        return node
+
+    async def delete_node(self, node_id: str) -> dict:
+        node = await self._request(
+            "DELETE", f"{self.node_url}/{node_id}", "Node deletion failed"
         )
-        if node.status_code == 200:
-            return node.json()
-        elif node.status_code == 401:
-            self._auth()
-            return self.delete_node(node_id)
-        else:
-            raise Exception(f"Node deletion failed: {node.text}")
+        await self._invalidate_nodes()
+        return node
 
 
-if __name__ == "__main__":
+async def _main() -> None:
     node = NodeSetup(
         os.getenv("MARZBAN_USERNAME"),
         os.getenv("MARZBAN_PASSWORD"),
         os.getenv("MARZBAN_URL"),
     )
-    print(node.get_nodes())
+    try:
+        print(await node.get_nodes())
+    finally:
+        await node.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,9 +1,31 @@
+import io
 import os
-import tempfile
+import time
 from fabric import Connection
-from typing import Dict, Any
+from typing import Dict, Any, NamedTuple, Tuple
 
-import requests
+import aiohttp
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MARZBAN_NODE_CERT = os.getenv("MARZBAN_NODE_CERT")
+
+GEO_CACHE_TTL = 86400
+GEO_CACHE_SIZE = 1024
+
+
+class GeoInfo(NamedTuple):
+    """Geo-information about an IP address"""
+
+    display: str
+    country: str
+
+
+UNKNOWN_GEO = GeoInfo("Ghost", "Unknown")
+
+_geo_cache: Dict[str, Tuple[float, GeoInfo]] = {}
 
 
 class ServerManager:
@@ -29,69 +51,53 @@ class ServerManager:
 
     def setup_marzban_node(self, service_port: int, api_port: int) -> Dict[str, Any]:
         """Setting up a Marzban node on the server"""
+        # The bot checks the certificate at startup; this guards direct use
+        if not MARZBAN_NODE_CERT:
+            return {"success": False, "error": "Certificate not found in environment"}
+
         if not self.connection:
             if not self.connect():
                 return {"success": False, "error": "Failed to connect to server"}
 
         try:
-            certificate = os.getenv("MARZBAN_NODE_CERT")
-            if not certificate:
-                return {
-                    "success": False,
-                    "error": "Certificate not found in environment",
-                }
-
             script_content = self._generate_setup_script(
-                certificate, service_port, api_port
+                MARZBAN_NODE_CERT, service_port, api_port
             )
 
-            with tempfile.NamedTemporaryFile(
-                mode="w", delete=False, suffix=".sh"
-            ) as temp_file:
-                temp_file.write(script_content)
-                temp_file.flush()
-                temp_file_path = temp_file.name
-
             try:
-                with self.connection.cd("/tmp"):
-                    result = self.connection.run(
-                        f"cat > setup_node.sh << 'SCRIPTEOF'\n{script_content}\nSCRIPTEOF",
-                        hide=True,
-                    )
-                    if result.failed:
-                        return {
-                            "success": False,
-                            "error": f"Failed to create script: {result.stderr}",
-                        }
-
-                    result = self.connection.run(
-                        "sudo chmod 755 setup_node.sh", hide=True
-                    )
-                    if result.failed:
-                        return {
-                            "success": False,
-                            "error": f"Failed to set permissions: {result.stderr}",
-                        }
-
-                    result = self.connection.run("sudo bash ./setup_node.sh", hide=True)
-                    if result.failed:
-                        return {
-                            "success": False,
-                            "error": f"Setup failed: {result.stderr}",
-                        }
-
-                    self.connection.run("sudo rm -f setup_node.sh", hide=True)
+                self.connection.put(
+                    io.BytesIO(script_content.encode()), remote="/tmp/setup_node.sh"
+                )
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"Failed to upload script: {str(e)}",
+                }
 
+            with self.connection.cd("/tmp"):
+                result = self.connection.run("sudo chmod 755 setup_node.sh", hide=True)
+                if result.failed:
                     return {
-                        "success": True,
-                        "message": f"Node setup completed successfully! Available on port {service_port}",
-                        "host": self.host,
-                        "service_port": service_port,
-                        "api_port": api_port,
+                        "success": False,
+                        "error": f"Failed to set permissions: {result.stderr}",
                     }
 
-            finally:
-                os.unlink(temp_file_path)
+                result = self.connection.run("sudo bash ./setup_node.sh", hide=True)
+                if result.failed:
+                    return {
+                        "success": False,
+                        "error": f"Setup failed: {result.stderr}",
+                    }
+
+                self.connection.run("sudo rm -f setup_node.sh", hide=True)
+
+                return {
+                    "success": True,
+                    "message": f"Node setup completed successfully! Available on port {service_port}",
+                    "host": self.host,
+                    "service_port": service_port,
+                    "api_port": api_port,
+                }
 
         except Exception as e:
             return {"success": False, "error": f"Setup error: {str(e)}"}
@@ -162,16 +168,34 @@ echo "[SUCCESS] Node setup completed! Node should be available on port {service_
             return False
 
 
-def get_geo_ip(ip: str) -> str:
-    """Getting geo-information by IP address"""
-    response = requests.get(f"https://ipapi.co/{ip}/json")
-    if response.status_code == 200:
-        return f"{response.json()['city']} ({response.json()['country_name']})"
-    elif response.status_code == 429:
-        response = requests.get(f"https://ipinfo.io/{ip}/json")
-        if response.status_code == 200:
-            return f"{response.json()['city']} ({response.json()['country']})"
+async def get_geo_ip(ip: str, session: aiohttp.ClientSession) -> GeoInfo:
+    """Getting geo-information by IP address, cached per IP"""
+    cached = _geo_cache.get(ip)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    geo_info = await _fetch_geo_ip(ip, session)
+    if geo_info is not UNKNOWN_GEO:
+        if len(_geo_cache) >= GEO_CACHE_SIZE:
+            _geo_cache.pop(next(iter(_geo_cache)))
+        _geo_cache[ip] = (time.monotonic() + GEO_CACHE_TTL, geo_info)
+    return geo_info
+
+
+async def _fetch_geo_ip(ip: str, session: aiohttp.ClientSession) -> GeoInfo:
+    """Requesting geo-information from ipapi.co with ipinfo.io fallback"""
+    async with session.get(f"https://ipapi.co/{ip}/json") as response:
+        if response.status == 200:
+            data = await response.json(loads=orjson.loads)
+            country = data["country_name"]
+            return GeoInfo(f"{data['city']} ({country})", country)
+        elif response.status != 429:
+            return UNKNOWN_GEO
+
+    async with session.get(f"https://ipinfo.io/{ip}/json") as response:
+        if response.status == 200:
+            data = await response.json(loads=orjson.loads)
+            country = data["country"]
+            return GeoInfo(f"{data['city']} ({country})", country)
         else:
-            return "Ghost"
-    else:
-        return "Ghost"
+            return UNKNOWN_GEO